@@ -0,0 +1,572 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for BikeArlingtonPy.
+
+Every benchmark replays synthetic counters.cfc XML, from memory or from a
+local stub server, so nothing here touches the Bike Arlington server or your
+database. Results are printed as JSON so runs can be compared. Run with:
+
+    python benchmarks.py
+    python benchmarks.py --scenarios year_hourly --concurrency 1 4 --output before.json
+
+@author: Nathan Goldberg
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+import sqlalchemy
+
+import BikeArlingtonPy as bap
+
+
+##########
+#Fixtures#
+##########
+
+def synthetic_count_xml(days, interval='h', start_date=date(2019, 1, 1), bikeometer_id=33, modes=('B',),
+                        directions=('I', 'O')) -> bytes:
+    '''
+    Builds a GetCountInDateRange response body with the directions asked for
+    (both by default) for every day, and every hour when interval is 'h' or
+    every minute, as hour and minute attributes, when it is 'm'. Counts are
+    labelled with their mode when more than one mode is asked for, like a
+    blank mode request.
+    '''
+    bikeometer_id = int(bikeometer_id)
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>\n<counts>\n']
+    for offset in range(days):
+        day = start_date + timedelta(days=offset)
+        day_string = f'{day.month}/{day.day}/{day.year}'
+        for mode_offset, mode in enumerate(modes):
+            mode_attribute = f' mode="{mode}"' if len(modes) > 1 else ''
+            for direction in directions:
+                if interval == 'h':
+                    for hour in range(24):
+                        count = (bikeometer_id * 7 + offset + hour + mode_offset) % 120
+                        lines.append(f'\t<count count="{count}" date="{day_string}"{mode_attribute} '
+                                     f'direction="{direction}" hour="{hour}"/>\n')
+                elif interval == 'm':
+                    for minute in range(24 * 60):
+                        count = (bikeometer_id * 7 + offset + minute + mode_offset) % 12
+                        lines.append(f'\t<count count="{count}" date="{day_string}"{mode_attribute} '
+                                     f'direction="{direction}" hour="{minute // 60}" minute="{minute % 60}"/>\n')
+                else:
+                    count = (bikeometer_id * 7 + offset + mode_offset) % 2000
+                    lines.append(f'\t<count count="{count}" date="{day_string}"{mode_attribute} direction="{direction}"/>\n')
+    lines.append('</counts>\n')
+    return ''.join(lines).encode('utf-8')
+
+
+def synthetic_counters_xml(bikeometer_ids) -> bytes:
+    ''' Builds a GetAllCounters response body listing the bikeometers'''
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>\n<counters>\n']
+    for position, bikeometer_id in enumerate(bikeometer_ids):
+        lines.append(f'\t<counter id="{bikeometer_id}">'
+                     f'<name>Counter {bikeometer_id}</name>'
+                     f'<description>Synthetic counter</description>'
+                     f'<latitude>{38.85 + position / 1000:.6f}</latitude>'
+                     f'<longitude>{-77.10 + position / 1000:.6f}</longitude>'
+                     f'<region><name>Arlington</name><region_id>{position % 3 + 1}</region_id></region>'
+                     f'<trail_id>1</trail_id><trail_name>Synthetic Trail</trail_name>'
+                     f'</counter>\n')
+    lines.append('</counters>\n')
+    return ''.join(lines).encode('utf-8')
+
+
+def parse_api_date(value):
+    ''' Reads an M/D/YYYY date sent to the API back into a date'''
+    return datetime.strptime(value, '%m/%d/%Y').date()
+
+
+@lru_cache(maxsize=64)
+def stub_response_body(method, bikeometer_id, start_date, end_date, mode, interval, direction='') -> bytes:
+    ''' Builds (once) the body the stub server answers a request with'''
+    if method == 'GetAllCounters':
+        return synthetic_counters_xml(bikeometer_id.split(','))
+    start = parse_api_date(start_date)
+    days = (parse_api_date(end_date) - start).days + 1
+    return synthetic_count_xml(days, interval, start, bikeometer_id,
+                               modes=(mode,) if mode else bap.COUNT_MODES,
+                               directions=(direction,) if direction else ('I', 'O'))
+
+
+class StubCountersServer:
+    '''
+    Local HTTP server answering GetCountInDateRange and GetAllCounters with
+    synthetic XML, so benchmarks go through the real CountersClient (pooled
+    keep-alive connections, streaming, parsing) without leaving the machine.
+
+    Parameters
+    ----------
+    bikeometer_ids : list
+        IDs listed by GetAllCounters
+    latency : float, optional
+        Seconds slept before every response, standing in for the network.
+        The default is 0.
+    statuses : list, optional
+        HTTP statuses answered, in order, to the first requests before the
+        server starts answering 200, to exercise retries and error handling.
+        The default is none.
+    '''
+
+    def __init__(self, bikeometer_ids, latency=0.0, statuses=()):
+        self.bikeometer_ids = [str(bikeometer_id) for bikeometer_id in bikeometer_ids]
+        self.latency = latency
+        self.statuses = deque(statuses)
+        # Number of requests answered, error statuses included
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keeps connections alive like the real server, so the client's pool is exercised
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                params = {name: values[0] for name, values in parse_qs(urlsplit(self.path).query, keep_blank_values=True).items()}
+                if stub.latency:
+                    time.sleep(stub.latency)
+                with stub._lock:
+                    stub.request_count += 1
+                    status = stub.statuses.popleft() if stub.statuses else 200
+                if status != 200:
+                    self.send_response(status)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = stub_response_body(params.get('method'),
+                                          params.get('counterID', ','.join(stub.bikeometer_ids)),
+                                          params.get('startDate'),
+                                          params.get('endDate'),
+                                          params.get('mode', ''),
+                                          params.get('interval', 'd'),
+                                          params.get('direction', ''))
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/xml')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/counters.cfc'
+
+    def __enter__(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self.make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+        return False
+
+
+class ReplayResponse:
+    ''' Minimal stand-in for a streamed requests.Response holding a canned body'''
+
+    def __init__(self, body):
+        self.body = body
+        self.content = body
+        self.text = body.decode('utf-8')
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class ReplayClient:
+    ''' Stand-in for CountersClient that answers every request with the same body'''
+
+    base_url = bap.url
+
+    def __init__(self, body):
+        self.body = body
+
+    def get(self, params, stream=False):
+        return ReplayResponse(self.body)
+
+    def stream(self, params):
+        return nullcontext(bap.iter_body_chunks(self.body))
+
+
+# Fixture sizes: a week of daily counts, a year of hourly counts, and many counters
+SCENARIOS = {'small': {'bikeometer_ids': ['33'], 'days': 7, 'interval': 'd'},
+             'year_hourly': {'bikeometer_ids': ['33'], 'days': 365, 'interval': 'h'},
+             'multi_counter': {'bikeometer_ids': [str(bikeometer_id) for bikeometer_id in range(1, 17)],
+                               'days': 90, 'interval': 'h'}}
+SCENARIO_START_DATE = date(2019, 1, 1)
+
+# Concurrency levels the end-to-end backfill is timed at
+DEFAULT_CONCURRENCY_LEVELS = (1, 2, 4, 8)
+
+# Seconds the stub server waits before answering, roughly a round trip to the real API
+DEFAULT_LATENCY = 0.05
+
+# Dependencies BikeArlingtonPy must not import until they are used
+HEAVY_MODULES = ('numpy', 'pandas', 'requests', 'sqlalchemy')
+
+# Run in a fresh interpreter: times the import and lists the heavy modules it pulled in
+IMPORT_PROBE = """
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+import BikeArlingtonPy
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'loaded': [name for name in sys.argv[2:] if name in sys.modules]}))
+"""
+
+
+############
+#Benchmarks#
+############
+
+def best_of(function, repeat=3):
+    ''' Returns the fastest wall-clock time in seconds over repeat runs'''
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def peak_rss_mb():
+    ''' Returns the peak resident set size of this process in MB, None where it can't be read'''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def benchmark_parse(scenario='year_hourly', repeat=3) -> dict:
+    '''
+    Times the two stages of the columnar path separately on one counter's
+    response: the streaming XML parse into raw columns, then the dataframe build.
+
+    Returns
+    -------
+    Dictionary with the row count, response size, and seconds and rows/sec per stage.
+    '''
+    config = SCENARIOS[scenario]
+    body = synthetic_count_xml(config['days'], config['interval'], SCENARIO_START_DATE)
+    columns = {}
+
+    def parse():
+        columns.update(bap.collect_count_columns(bap.iter_body_chunks(body), config['interval']))
+
+    parse_seconds = best_of(parse, repeat)
+    rows = len(columns['count'])
+    build_seconds = best_of(lambda: bap.count_columns_to_dataframe('33', columns, config['interval']), repeat)
+    return {'benchmark': 'parse',
+            'scenario': scenario,
+            'interval': config['interval'],
+            'rows': rows,
+            'bytes': len(body),
+            'parse_seconds': parse_seconds,
+            'parse_rows_per_sec': rows / parse_seconds,
+            'parse_mb_per_sec': len(body) / 1024 ** 2 / parse_seconds,
+            'build_seconds': build_seconds,
+            'build_rows_per_sec': rows / build_seconds}
+
+
+def benchmark_import(repeat=5) -> dict:
+    '''
+    Times importing BikeArlingtonPy, and running its --help, in fresh interpreters,
+    the cost a short-lived worker pays before doing anything.
+
+    Returns
+    -------
+    Dictionary with the fastest import, --help and bare interpreter start times in
+    seconds, and the HEAVY_MODULES the import loaded, which should be none.
+    '''
+    directory = os.path.dirname(os.path.abspath(bap.__file__))
+    probes = [json.loads(subprocess.run([sys.executable, '-c', IMPORT_PROBE, directory, *HEAVY_MODULES],
+                                        capture_output=True, text=True, check=True).stdout)
+              for _ in range(repeat)]
+
+    def run(*args):
+        subprocess.run([sys.executable, *args], capture_output=True, check=True)
+
+    return {'benchmark': 'import',
+            'import_seconds': min(probe['seconds'] for probe in probes),
+            'cli_help_seconds': best_of(lambda: run(os.path.abspath(bap.__file__), '--help'), repeat),
+            'interpreter_seconds': best_of(lambda: run('-c', 'pass'), repeat),
+            'heavy_modules_loaded': sorted(set().union(*(probe['loaded'] for probe in probes)))}
+
+
+def benchmark_get_all_counters(bikeometer_ids, repeat=3) -> dict:
+    ''' Times a GetAllCounters request and parse against the stub server'''
+    with StubCountersServer(bikeometer_ids) as server:
+        client = bap.CountersClient(base_url=server.url)
+        counters = bap.get_all_counters(client=client)
+        seconds = best_of(lambda: bap.get_all_counters(client=client), repeat)
+        client.close()
+    return {'benchmark': 'get_all_counters',
+            'counters': len(counters),
+            'seconds': seconds}
+
+
+def run_backfill(base_url, bikeometer_ids, start_date, end_date, interval, max_workers, db_path) -> dict:
+    '''
+    Runs a sync() of the whole date range against the stub server into a new SQLite file.
+
+    Meant to run in a fresh process, so the peak RSS it reports belongs to
+    this backfill alone. Windows are a year each, so runs stay comparable
+    whatever earlier syncs taught the adaptive window planner.
+    '''
+    client = bap.CountersClient(base_url=base_url, pool_size=max_workers)
+    start = time.perf_counter()
+    jobs = bap.sync(interval=interval,
+                    counters=bikeometer_ids,
+                    start_date=start_date,
+                    end_date=end_date,
+                    target='sqlite',
+                    db_name=db_path,
+                    max_workers=max_workers,
+                    requests_per_second=0,
+                    client=client,
+                    adaptive_windows=False)
+    seconds = time.perf_counter() - start
+    client.close()
+    engine = bap.create_new_engine(db_path, dialect='sqlite')
+    with engine.connect() as con:
+        rows = con.execute(sqlalchemy.text(f'SELECT COUNT(*) FROM {bap.INTERVAL_TABLES[interval]}')).scalar()
+    engine.dispose()
+    return {'requests': len(jobs),
+            'rows': rows,
+            'seconds': seconds,
+            'rows_per_sec': rows / seconds,
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def benchmark_end_to_end(scenario='multi_counter', concurrency_levels=DEFAULT_CONCURRENCY_LEVELS,
+                         latency=DEFAULT_LATENCY) -> list:
+    '''
+    Times a full backfill of a scenario, from HTTP requests to committed rows
+    and rollups, at several concurrency levels.
+
+    Every level runs in a freshly spawned process against the same stub
+    server, so timings and peak RSS don't carry over between levels.
+
+    Returns
+    -------
+    List of dictionaries, one per concurrency level.
+    '''
+    config = SCENARIOS[scenario]
+    end_date = SCENARIO_START_DATE + timedelta(days=config['days'] - 1)
+    results = []
+    with StubCountersServer(config['bikeometer_ids'], latency) as server, \
+            tempfile.TemporaryDirectory() as temporary_directory:
+        for max_workers in concurrency_levels:
+            db_path = os.path.join(temporary_directory, f'backfill_{max_workers}')
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                result = executor.submit(run_backfill, server.url, config['bikeometer_ids'], SCENARIO_START_DATE,
+                                         end_date, config['interval'], max_workers, db_path).result()
+            results.append({'benchmark': 'end_to_end',
+                            'scenario': scenario,
+                            'interval': config['interval'],
+                            'concurrency': max_workers,
+                            'latency': latency,
+                            **result})
+    return results
+
+
+def benchmark_row_builders(days=365, interval='h', repeat=3) -> dict:
+    '''
+    Compares the tuple-per-row api_counts_to_list path against the columnar
+    api_counts_to_dataframe path, both ending in a dataframe.
+
+    Returns
+    -------
+    Dictionary with the row count, seconds per path and rows/sec per path.
+    '''
+    client = ReplayClient(synthetic_count_xml(days, interval))
+    hourly = interval == 'h'
+    columns = ('bikeometer_id', 'date', 'mode', 'direction', 'count') + (('hour',) if hourly else ()) + \
+              ('is_weekend', 'year', 'month', 'day', 'month_day')
+
+    def row_path():
+        rows = bap.api_counts_to_list('33', '1/1/2019', '12/31/2019', [], interval=interval, client=client)
+        return pd.DataFrame(rows, columns=columns)
+
+    def columnar_path():
+        return bap.api_counts_to_dataframe('33', '1/1/2019', '12/31/2019', interval=interval, client=client)
+
+    rows = len(columnar_path())
+    row_seconds = best_of(row_path, repeat)
+    columnar_seconds = best_of(columnar_path, repeat)
+    return {'benchmark': 'row_builders',
+            'interval': interval,
+            'rows': rows,
+            'row_seconds': row_seconds,
+            'columnar_seconds': columnar_seconds,
+            'row_rows_per_sec': rows / row_seconds,
+            'columnar_rows_per_sec': rows / columnar_seconds,
+            'speedup': row_seconds / columnar_seconds}
+
+
+def benchmark_loaders(days=365, engine=None, loaders=None, chunksize=bap.DEFAULT_LOAD_CHUNKSIZE) -> list:
+    '''
+    Measures rows/sec into a table for pandas' default to_sql and each bulk loader.
+
+    Parameters
+    ----------
+    days : int, optional
+        Days of synthetic hourly counts to load.
+    engine : sqlalchemy engine, optional
+        Database to load into. The default is a temporary SQLite file.
+    loaders : list, optional
+        Names from BULK_LOADERS. The default is every loader the engine supports,
+        'infile' only being tried against MySQL.
+    chunksize : int, optional
+        Rows per executemany call.
+
+    Returns
+    -------
+    List of dictionaries, one per loader.
+    '''
+    client = ReplayClient(synthetic_count_xml(days, 'h'))
+    df = bap.api_counts_to_dataframe('33', '1/1/2019', '12/31/2019', interval='h', client=client)
+    temporary_directory = None
+    if engine is None:
+        temporary_directory = tempfile.TemporaryDirectory()
+        engine = bap.create_new_engine(os.path.join(temporary_directory.name, 'benchmark'), dialect='sqlite')
+    if loaders is None:
+        loaders = ['executemany', 'sqlite'] if engine.dialect.name == 'sqlite' else ['executemany', 'infile']
+
+    def load(loader):
+        if loader == 'pandas_to_sql':
+            df.to_sql('benchmark_counts', con=engine, index=False, if_exists='replace', dtype=bap.count_schema().sql_dtypes)
+        else:
+            bap.load_dataframe(df, 'benchmark_counts', engine, if_exists='replace', loader=loader, chunksize=chunksize)
+
+    results = []
+    for name in ['pandas_to_sql'] + loaders:
+        seconds = best_of(lambda: load(name), repeat=1)
+        results.append({'benchmark': 'loaders',
+                        'dialect': engine.dialect.name,
+                        'loader': name,
+                        'rows': len(df),
+                        'seconds': seconds,
+                        'rows_per_sec': len(df) / seconds})
+    engine.dispose()
+    if temporary_directory is not None:
+        temporary_directory.cleanup()
+    return results
+
+
+def run_suite(scenarios=tuple(SCENARIOS), concurrency_levels=DEFAULT_CONCURRENCY_LEVELS,
+              latency=DEFAULT_LATENCY, repeat=3, mysql_db=None) -> dict:
+    '''
+    Runs every benchmark and returns the results with the environment they ran in.
+
+    Parameters
+    ----------
+    scenarios : list, optional
+        Names from SCENARIOS to parse and backfill. The default is all of them.
+    concurrency_levels : list, optional
+        max_workers values the end-to-end backfills are timed at.
+    latency : float, optional
+        Seconds the stub server waits before every response.
+    repeat : int, optional
+        Runs per in-process timing, the fastest is kept.
+    mysql_db : Str, optional
+        Also time the loaders against this MySQL database, see create_new_engine.
+
+    Returns
+    -------
+    Dictionary of {'environment': {...}, 'results': [...]}, ready for json.dump.
+    '''
+    results = [benchmark_import(repeat)]
+    for scenario in scenarios:
+        results.append(benchmark_parse(scenario, repeat))
+    for interval in ('d', 'h'):
+        results.append(benchmark_row_builders(interval=interval, repeat=repeat))
+    results.append(benchmark_get_all_counters(SCENARIOS['multi_counter']['bikeometer_ids'], repeat))
+    results += benchmark_loaders()
+    if mysql_db:
+        results += benchmark_loaders(engine=bap.create_new_engine(mysql_db, local_infile=True))
+    for scenario in scenarios:
+        results += benchmark_end_to_end(scenario, concurrency_levels, latency)
+    environment = {'timestamp': datetime.now().isoformat(timespec='seconds'),
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'cpu_count': os.cpu_count(),
+                   'pandas': pd.__version__,
+                   'sqlalchemy': sqlalchemy.__version__,
+                   'peak_rss_mb': peak_rss_mb()}
+    return {'environment': environment, 'results': results}
+
+
+def main(argv=None):
+    ''' Command line entry point, run with python benchmarks.py --help'''
+    parser = argparse.ArgumentParser(description='Benchmark BikeArlingtonPy against synthetic API fixtures.')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=list(DEFAULT_CONCURRENCY_LEVELS),
+                        help='max_workers levels for the end-to-end backfills')
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY, help='seconds the stub server waits per response')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per timing, the fastest is kept')
+    parser.add_argument('--mysql', help='also time the loaders against this MySQL database')
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--import-only', action='store_true', help='only time importing BikeArlingtonPy')
+    parser.add_argument('--max-import-ms', type=float,
+                        help='exit with status 1 if the import takes longer than this or loads a heavy module')
+    args = parser.parse_args(argv)
+    if args.import_only:
+        report = {'results': [benchmark_import(args.repeat)]}
+    else:
+        report = run_suite(args.scenarios, args.concurrency, args.latency, args.repeat, args.mysql)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.max_import_ms is not None:
+        result = next(result for result in report['results'] if result['benchmark'] == 'import')
+        if result['heavy_modules_loaded'] or result['import_seconds'] * 1000 > args.max_import_ms:
+            sys.exit(f"Importing BikeArlingtonPy took {result['import_seconds'] * 1000:.0f} ms "
+                     f"and loaded {result['heavy_modules_loaded'] or 'no heavy modules'}, "
+                     f"the budget is {args.max_import_ms:g} ms and none")
+
+
+if __name__ == '__main__':
+    main()
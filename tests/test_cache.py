@@ -0,0 +1,69 @@
+'''
+Tests the on-disk ResponseCache in a temporary directory.
+'''
+import os
+import time
+from datetime import date, timedelta
+
+import pytest
+
+import BikeArlingtonPy as bap
+from benchmarks import StubCountersServer
+
+
+def count_params(end_date, bikeometer_id=33):
+    return {'method': 'GetCountInDateRange', 'counterID': str(bikeometer_id), 'startDate': '1/1/2020',
+            'endDate': bap.api_date(end_date), 'mode': 'B', 'interval': 'd', 'direction': ''}
+
+
+def age(cache, params, seconds):
+    modified = time.time() - seconds
+    os.utime(cache.path(params), (modified, modified))
+
+
+def test_open_windows_expire_after_the_ttl(tmp_path):
+    cache = bap.ResponseCache(str(tmp_path), ttl=60)
+    params = count_params(date.today())
+    cache.put(params, b'<counts/>')
+    assert cache.get(params) == b'<counts/>'
+    age(cache, params, 120)
+    assert cache.get(params) is None
+
+
+def test_closed_windows_never_expire(tmp_path):
+    cache = bap.ResponseCache(str(tmp_path), ttl=60)
+    params = count_params(date.today() - timedelta(days=30))
+    cache.put(params, b'<counts/>')
+    age(cache, params, 365 * 24 * 60 * 60)
+    assert cache.get(params) == b'<counts/>'
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path):
+    # Random bodies don't compress, so every entry is a little over 1000 bytes
+    bodies = [os.urandom(1000) for _ in range(4)]
+    params = [count_params(date(2020, 1, 31), bikeometer_id) for bikeometer_id in range(4)]
+    cache = bap.ResponseCache(str(tmp_path), max_bytes=3500)
+    for offset, (request, body) in enumerate(zip(params[:3], bodies)):
+        cache.put(request, body)
+        age(cache, request, 100 - offset)
+    # Reading the oldest makes the second one the least recently used
+    assert cache.get(params[0]) == bodies[0]
+    cache.put(params[3], bodies[3])
+    assert cache.get(params[1]) is None
+    assert [cache.get(request) for request in (params[0], params[2], params[3])] == [bodies[0], bodies[2], bodies[3]]
+    assert sum(size for _, size, _ in cache.entries()) <= 3500
+
+
+def test_offline_cache_misses_raise_without_a_request(tmp_path):
+    with StubCountersServer([33]) as server:
+        cache = bap.ResponseCache(str(tmp_path), settle_days=0)
+        online = bap.CountersClient(base_url=server.url, timeout=5, backoff_factor=0, cache=cache)
+        counts = bap.api_counts_to_dataframe(33, '1/1/2020', '1/31/2020', client=online)
+        assert server.request_count == 1
+        offline = bap.CountersClient(base_url=server.url, timeout=5, backoff_factor=0,
+                                     cache=bap.ResponseCache(str(tmp_path), settle_days=0, offline=True))
+        # Cached responses are still served offline, anything else is a miss
+        assert bap.api_counts_to_dataframe(33, '1/1/2020', '1/31/2020', client=offline).equals(counts)
+        with pytest.raises(bap.CacheMissError):
+            bap.api_counts_to_dataframe(33, '2/1/2020', '2/29/2020', client=offline)
+        assert server.request_count == 1
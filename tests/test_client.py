@@ -0,0 +1,75 @@
+'''
+Tests CountersClient against the local stub server from benchmarks.py, so
+requests go through a real HTTP connection without leaving the machine.
+'''
+from datetime import date
+
+import pytest
+import requests
+
+import BikeArlingtonPy as bap
+from benchmarks import StubCountersServer
+
+
+def make_client(server, max_retries=2):
+    # No backoff so retries don't slow the tests down
+    return bap.CountersClient(base_url=server.url, timeout=5, max_retries=max_retries, backoff_factor=0)
+
+
+def test_get_all_counters_parses_the_inventory():
+    with StubCountersServer([33, 10]) as server:
+        counters = bap.get_all_counters(client=make_client(server))
+    assert [counter[0] for counter in counters] == ['33', '10']
+
+
+def test_daily_counts_are_parsed():
+    jobs = [('33', date(2024, 1, 1), date(2024, 1, 10))]
+    with StubCountersServer([33]) as server:
+        batches = list(bap.iter_count_batches(jobs, mode='B', interval='d', client=make_client(server)))
+    counts, loaded_jobs = batches[0]
+    assert loaded_jobs == jobs
+    # One row per day and direction
+    assert len(counts) == 20
+    assert set(counts['direction']) == {'I', 'O'}
+    assert counts['date'].min().date() == date(2024, 1, 1)
+    assert counts['date'].max().date() == date(2024, 1, 10)
+
+
+def test_hourly_counts_are_parsed():
+    jobs = [('33', date(2024, 1, 1), date(2024, 1, 2))]
+    with StubCountersServer([33]) as server:
+        batches = list(bap.iter_count_batches(jobs, mode='B', interval='h', client=make_client(server)))
+    counts, loaded_jobs = batches[0]
+    assert loaded_jobs == jobs
+    assert len(counts) == 2 * 2 * 24
+    assert sorted(set(counts['hour'])) == list(range(24))
+
+
+def test_one_direction_is_returned_when_asked_for():
+    with StubCountersServer([33]) as server:
+        counts = bap.api_counts_to_dataframe(33, '1/1/2024', '1/2/2024', mode='B', interval='h', direction='I',
+                                             client=make_client(server))
+    assert len(counts) == 2 * 24
+    assert set(counts['direction']) == {'I'}
+
+
+def test_server_errors_are_retried():
+    with StubCountersServer([33], statuses=[503, 502]) as server:
+        response = make_client(server).get({'method': 'GetAllCounters'})
+        assert response.status_code == 200
+        assert b'<counter' in response.content
+        assert server.request_count == 3
+
+
+def test_server_errors_raise_once_retries_run_out():
+    with StubCountersServer([33], statuses=[500, 500, 500, 500]) as server:
+        with pytest.raises(requests.HTTPError):
+            make_client(server, max_retries=2).get({'method': 'GetAllCounters'})
+        assert server.request_count == 3
+
+
+def test_client_errors_are_not_retried():
+    with StubCountersServer([33], statuses=[404]) as server:
+        with pytest.raises(requests.HTTPError):
+            make_client(server).get({'method': 'GetAllCounters'})
+        assert server.request_count == 1
@@ -0,0 +1,58 @@
+'''
+Tests CounterIndex queries against brute force distances, on grids small
+enough that the answers sit in other cells than the query points.
+'''
+import numpy as np
+import pandas as pd
+
+import BikeArlingtonPy as bap
+
+
+def random_details(count=200, seed=7):
+    # About 11 km by 9 km around Arlington
+    generator = np.random.default_rng(seed)
+    return pd.DataFrame({'bikeometer_id': [str(position) for position in range(count)],
+                         'latitude': 38.85 + generator.uniform(-0.05, 0.05, count),
+                         'longitude': -77.10 + generator.uniform(-0.05, 0.05, count),
+                         'region_id': [str(position % 3 + 1) for position in range(count)]})
+
+
+def query_points(count=50, seed=11):
+    generator = np.random.default_rng(seed)
+    return zip(38.85 + generator.uniform(-0.07, 0.07, count), -77.10 + generator.uniform(-0.07, 0.07, count))
+
+
+def test_nearest_matches_brute_force_across_cells():
+    index = bap.CounterIndex(random_details(), cell_km=0.25)
+    for latitude, longitude in query_points():
+        expected = list(index.distances(latitude, longitude).index[:5])
+        assert index.nearest(latitude, longitude, k=5) == expected
+        assert index.nearest(latitude, longitude) == expected[:1]
+
+
+def test_within_radius_matches_brute_force_across_cells():
+    index = bap.CounterIndex(random_details(), cell_km=0.25)
+    for latitude, longitude in query_points():
+        distances = index.distances(latitude, longitude)
+        for radius_km in (0.1, 0.6, 2.5):
+            assert index.within_radius(latitude, longitude, radius_km) == list(distances.index[distances <= radius_km])
+
+
+def test_nearest_widens_the_search_past_empty_cells():
+    # Two bikeometers about 5.5 km apart on a 0.5 km grid, nothing in between
+    details = pd.DataFrame({'bikeometer_id': ['1', '2'], 'latitude': [38.80, 38.85],
+                            'longitude': [-77.10, -77.10], 'region_id': ['1', '1']})
+    index = bap.CounterIndex(details, cell_km=0.5)
+    assert index.nearest(38.82, -77.10) == ['1']
+    assert index.nearest(38.83, -77.10, k=2) == ['2', '1']
+    assert index.within_radius(38.825, -77.10, 2) == []
+    # k past the number of bikeometers returns all of them
+    assert index.nearest(38.80, -77.10, k=5) == ['1', '2']
+
+
+def test_missing_coordinates_are_left_out():
+    details = random_details(10)
+    details.loc[3, 'latitude'] = np.nan
+    index = bap.CounterIndex(details, cell_km=0.25)
+    assert len(index) == 9
+    assert '3' not in index.nearest(38.85, -77.10, k=10)
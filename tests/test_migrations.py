@@ -0,0 +1,72 @@
+'''
+Tests the migration of counts tables written by older versions of the module,
+on temporary SQLite databases.
+'''
+import pandas as pd
+import pytest
+import sqlalchemy
+
+import BikeArlingtonPy as bap
+
+
+def legacy_hourly_counts():
+    # Re-loaded windows left the first hour twice, counts and hours stored as text
+    return pd.DataFrame({'bikeometer_id': [33, 33, 33],
+                         'date': ['2024-01-01', '2024-01-01', '2024-01-02'],
+                         'direction': ['I', 'I', 'I'],
+                         'count': ['5', '5', '9'],
+                         'hour': ['1', '1', '2']})
+
+
+def stored_rows(engine, table_name):
+    with engine.connect() as con:
+        return con.exec_driver_sql(f'SELECT bikeometer_id, date, hour, mode, direction, count, typeof(count), typeof(hour) '
+                                   f'FROM {table_name} ORDER BY date').fetchall()
+
+
+def test_duplicated_table_without_mode_is_migrated(tmp_path):
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path}/counts.db')
+    legacy_hourly_counts().to_sql('counts_hourly', engine, index=False)
+    bap.create_count_tables(engine, table_names=['counts_hourly'])
+    assert stored_rows(engine, 'counts_hourly') == [(33, '2024-01-01', 1, 'B', 'I', 5, 'integer', 'integer'),
+                                                    (33, '2024-01-02', 2, 'B', 'I', 9, 'integer', 'integer')]
+    inspector = sqlalchemy.inspect(engine)
+    assert inspector.get_table_names() == ['counts_hourly']
+    assert inspector.get_pk_constraint('counts_hourly')['constrained_columns']
+
+
+def test_failed_migration_leaves_the_old_table(tmp_path, monkeypatch):
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path}/counts.db')
+    legacy_hourly_counts().to_sql('counts_hourly', engine, index=False)
+    table = bap.count_schema().count_tables['counts_hourly']
+
+    def failing_insert(*args, **kwargs):
+        raise RuntimeError('copy failed')
+
+    monkeypatch.setattr(table, 'insert', failing_insert)
+    with pytest.raises(RuntimeError):
+        bap.create_count_tables(engine, table_names=['counts_hourly'])
+    inspector = sqlalchemy.inspect(engine)
+    assert inspector.get_table_names() == ['counts_hourly']
+    assert 'mode' not in [column['name'] for column in inspector.get_columns('counts_hourly')]
+    with engine.connect() as con:
+        assert con.exec_driver_sql('SELECT COUNT(*) FROM counts_hourly').scalar() == 3
+
+
+def daily_counts():
+    columns = {'count': ['5', '6'], 'date': ['1/1/2024', '1/1/2024'], 'mode': ['B', 'B'], 'direction': ['I', 'O']}
+    return bap.count_columns_to_dataframe(33, columns, 'd')
+
+
+def test_keyless_table_is_keyed_before_upserts(tmp_path):
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path}/counts.db')
+    # DataFrame.to_sql tables have the mode column but no key
+    counts = daily_counts()
+    pd.concat([counts, counts]).to_sql('counts_daily', engine, index=False)
+    bap.create_count_tables(engine, table_names=['counts_daily'])
+    assert sqlalchemy.inspect(engine).get_pk_constraint('counts_daily')['constrained_columns']
+    for _ in range(2):
+        bap.upsert_sql(counts.assign(count=[7, 8]), 'counts_daily', engine)
+    with engine.connect() as con:
+        rows = con.exec_driver_sql('SELECT direction, count FROM counts_daily ORDER BY direction').fetchall()
+    assert rows == [('I', 7), ('O', 8)]
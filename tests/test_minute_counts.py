@@ -0,0 +1,65 @@
+'''
+Tests the narrow minute counts frame and its packed form.
+'''
+import logging
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import BikeArlingtonPy as bap
+from benchmarks import StubCountersServer
+
+
+def minute_columns(hours, minutes, counts):
+    return {'count': counts,
+            'date': ['1/2/2024'] * len(counts),
+            'mode': [None] * len(counts),
+            'direction': ['I'] * len(counts),
+            'hour': hours,
+            'minute': minutes}
+
+
+def test_minute_frame_has_the_minute_of_the_day():
+    counts = bap.count_columns_to_dataframe(33, minute_columns(['0', '1', '23'], ['5', '0', '59'], ['1', '2', '3']), 'm')
+    assert list(counts.columns) == ['bikeometer_id', 'date', 'mode', 'direction', 'count', 'minute', 'year']
+    assert counts['minute'].tolist() == [5, 60, 1439]
+    assert counts['count'].dtype == 'int16' and counts['minute'].dtype == 'int16'
+    assert counts['mode'].tolist() == ['B'] * 3
+    assert counts['year'].tolist() == [2024] * 3
+
+
+def test_minute_of_the_day_without_an_hour_attribute():
+    counts = bap.count_columns_to_dataframe(33, minute_columns([None, None], ['90', '1439'], ['4', '5']), 'm')
+    assert counts['minute'].tolist() == [90, 1439]
+
+
+def test_minute_rows_missing_attributes_are_skipped(caplog):
+    columns = minute_columns(['0', '0', 'x', '0', '0'], ['1', None, '3', '4', '75'], ['1', '2', '3', None, '5'])
+    with caplog.at_level(logging.WARNING, logger='BikeArlingtonPy'):
+        counts = bap.count_columns_to_dataframe(33, columns, 'm')
+    assert counts['minute'].tolist() == [1]
+    assert counts['count'].tolist() == [1]
+    assert 'Skipped 4 minute counts' in caplog.text
+
+
+def test_minute_counts_from_the_stub_server():
+    with StubCountersServer([33]) as server:
+        client = bap.CountersClient(base_url=server.url, timeout=5, backoff_factor=0)
+        counts = bap.api_counts_to_dataframe(33, '1/1/2024', '1/1/2024', mode='B', interval='m', client=client)
+    assert len(counts) == 2 * 24 * 60
+    assert sorted(set(counts['minute'])) == list(range(24 * 60))
+
+
+def test_pack_and_unpack_round_trip():
+    with StubCountersServer([33]) as server:
+        client = bap.CountersClient(base_url=server.url, timeout=5, backoff_factor=0)
+        counts = bap.api_counts_to_dataframe(33, '1/1/2024', '1/2/2024', mode='B', interval='m', client=client)
+    keys, offsets, minutes, counts_array = bap.pack_minute_counts(counts)
+    assert len(keys) == 2 * 2
+    assert offsets[0] == 0 and offsets[-1] == len(counts)
+    assert np.all(np.diff(offsets) == 24 * 60)
+    unpacked = bap.unpack_minute_counts(keys, offsets, minutes, counts_array)
+    key_columns = ['bikeometer_id', 'date', 'mode', 'direction', 'minute']
+    expected = counts.sort_values(key_columns, ignore_index=True)
+    pd.testing.assert_frame_equal(unpacked[expected.columns], expected, check_categorical=False)
@@ -0,0 +1,65 @@
+'''
+Tests the data quality checks on small daily count frames.
+'''
+from datetime import date, timedelta
+
+import sqlalchemy
+
+import BikeArlingtonPy as bap
+
+JOB = ('33', date(2024, 3, 4), date(2024, 3, 13))
+
+
+def daily_frame(counts, start_date=JOB[1]):
+    ''' Inbound bicycle counts of bikeometer 33 from start_date, None leaving the day out'''
+    days = [(start_date + timedelta(days=offset), count) for offset, count in enumerate(counts) if count is not None]
+    columns = {'count': [str(count) for day, count in days],
+               'date': [f'{day.month}/{day.day}/{day.year}' for day, count in days],
+               'mode': ['B'] * len(days),
+               'direction': ['I'] * len(days)}
+    return bap.count_columns_to_dataframe(33, columns, 'd')
+
+
+def issue_spans(issues, issue):
+    found = issues[issues['issue'] == issue]
+    return [(start.date(), end.date(), periods)
+            for start, end, periods in found[['period_start', 'period_end', 'periods']].itertuples(index=False, name=None)]
+
+
+def test_missing_days_are_one_issue_per_gap():
+    issues = bap.find_quality_issues(daily_frame([100, 100, None, None, 100, 100, 100, 100, 100, None]), [JOB], 'd')
+    assert issue_spans(issues, 'missing') == [(date(2024, 3, 6), date(2024, 3, 7), 2),
+                                              (date(2024, 3, 13), date(2024, 3, 13), 1)]
+
+
+def test_only_long_enough_zero_runs_are_flagged():
+    issues = bap.find_quality_issues(daily_frame([100, 0, 0, 100, 0, 0, 0, 100, 100, 100]), [JOB], 'd')
+    assert issue_spans(issues, 'zeros') == [(date(2024, 3, 8), date(2024, 3, 10), 3)]
+    assert issue_spans(issues, 'missing') == []
+
+
+def test_outliers_are_measured_against_the_same_weekday():
+    history_start = JOB[1] - timedelta(weeks=8)
+    # Weekdays count about 100, weekends about 40, for eight weeks
+    history = daily_frame([100 + offset % 3 if (history_start + timedelta(days=offset)).weekday() < 5 else 40
+                           for offset in range(8 * 7)], history_start)
+    # The 6th is four times a usual Wednesday, the weekend of the 9th and 10th is as quiet as usual
+    batch = [100, 100, 400, 100, 100, 40, 40, 100, 100, 100]
+    issues = bap.find_quality_issues(daily_frame(batch), [JOB], 'd', history=history)
+    outliers = issues[issues['issue'] == 'outlier']
+    assert issue_spans(issues, 'outlier') == [(date(2024, 3, 6), date(2024, 3, 6), 1)]
+    assert outliers['expected'].iloc[0] == 101
+
+
+def test_issues_become_merged_refetch_jobs(tmp_path):
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path}/counts.db')
+    bap.create_count_tables(engine, table_names=['counts_daily'])
+    bap.count_schema().metadata.create_all(engine, tables=[bap.count_schema().data_quality])
+    # A gap on the 6th and 7th running into zeros from the 8th to the 10th
+    with engine.begin() as con:
+        bap.record_quality_issues(con, daily_frame([100, 100, None, None, 0, 0, 0, 100, 100, 100]), [JOB], 'd', mode='B')
+    assert sorted(bap.get_quality_issues(engine, 'd')['issue']) == ['missing', 'zeros']
+    assert bap.plan_refetch_jobs(engine, 'd', 'B') == [('33', date(2024, 3, 6), date(2024, 3, 10))]
+    # Pedestrian syncs don't refetch bicycle issues
+    assert bap.plan_refetch_jobs(engine, 'd', 'P') == []
+    assert bap.plan_refetch_jobs(engine, 'd', 'B', max_refetches=0) == []
@@ -0,0 +1,55 @@
+'''
+Tests that get_counts results cached in the QueryCache go stale with every sync.
+'''
+from datetime import date
+
+import sqlalchemy
+
+import BikeArlingtonPy as bap
+from benchmarks import StubCountersServer
+
+
+def load(engine, server, window_start, window_end):
+    client = bap.CountersClient(base_url=server.url, timeout=5, backoff_factor=0)
+    bap.counts_to_sql_in_batches(engine, 'counts_daily', [('33', window_start, window_end)], mode='B',
+                                 client=client, max_workers=1, check_quality=False)
+
+
+def read_january(engine):
+    return bap.get_counts([33], date(2024, 1, 1), date(2024, 1, 31), engine=engine)
+
+
+def test_syncs_make_cached_counts_stale(tmp_path):
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path}/counts.db')
+    cache = bap.get_query_cache()
+    with StubCountersServer([33]) as server:
+        load(engine, server, date(2024, 1, 1), date(2024, 1, 15))
+        assert len(read_january(engine)) == 2 * 15
+        hits = cache.hits
+        assert len(read_january(engine)) == 2 * 15
+        assert cache.hits == hits + 1
+
+        # New days move the watermark
+        load(engine, server, date(2024, 1, 16), date(2024, 1, 31))
+        misses = cache.misses
+        assert len(read_january(engine)) == 2 * 31
+        assert cache.misses == misses + 1
+
+        # Re-loading an old window leaves the watermark but still changes the token
+        with engine.connect() as con:
+            token = bap.sync_token(con, 'd')
+        load(engine, server, date(2024, 1, 1), date(2024, 1, 15))
+        with engine.connect() as con:
+            assert bap.sync_token(con, 'd') != token
+        misses = cache.misses
+        read_january(engine)
+        assert cache.misses == misses + 1
+
+
+def test_cached_results_are_copies(tmp_path):
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path}/counts.db')
+    with StubCountersServer([33]) as server:
+        load(engine, server, date(2024, 1, 1), date(2024, 1, 15))
+    counts = read_january(engine)
+    counts['count'] = 0
+    assert read_january(engine)['count'].gt(0).any()
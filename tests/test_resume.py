@@ -0,0 +1,77 @@
+'''
+Tests that syncs stopped by server errors keep what they committed and can be
+resumed, against the stub server and temporary SQLite databases.
+'''
+from datetime import date
+
+import pytest
+import requests
+import sqlalchemy
+
+import BikeArlingtonPy as bap
+from benchmarks import StubCountersServer
+
+
+def make_client(server):
+    return bap.CountersClient(base_url=server.url, timeout=5, max_retries=0, backoff_factor=0)
+
+
+def stored_counters(engine, table_name='counts_daily'):
+    with engine.connect() as con:
+        return sorted(row[0] for row in con.execute(sqlalchemy.text(f'SELECT DISTINCT bikeometer_id FROM {table_name}')))
+
+
+def sync_january(client, **kwargs):
+    return bap.sync(interval='d', mode='B', counters=['33', '30'], start_date=date(2024, 1, 1), end_date=date(2024, 1, 31),
+                    target='sqlite', db_name='counts', client=client, max_workers=1, batch_size=1,
+                    check_quality=False, adaptive_windows=False, **kwargs)
+
+
+def test_failed_sync_keeps_committed_jobs_and_resumes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # The first counter's window is answered, the second one's fails
+    with StubCountersServer([33, 30], statuses=[200, 404]) as server:
+        with pytest.raises(requests.HTTPError):
+            sync_january(make_client(server))
+        engine = bap.create_new_engine('counts', dialect='sqlite')
+        assert stored_counters(engine) == [33]
+        run_id, settings, remaining_jobs = bap.get_unfinished_run(engine)
+        assert remaining_jobs == [('30', date(2024, 1, 1), date(2024, 1, 31))]
+
+        resumed_jobs = bap.sync(resume=True, target='sqlite', db_name='counts', client=make_client(server), max_workers=1)
+        assert resumed_jobs == remaining_jobs
+        # Only the job that failed was requested again
+        assert server.request_count == 3
+    assert stored_counters(engine) == [30, 33]
+    assert bap.get_unfinished_run(engine) is None
+    with engine.connect() as con:
+        assert con.execute(sqlalchemy.text('SELECT COUNT(*) FROM counts_daily')).scalar() == 2 * 2 * 31
+
+
+def test_failed_staging_swap_leaves_the_live_table(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    engine = bap.create_new_engine('counts', dialect='sqlite')
+    swap_in_staging_tables = bap.swap_in_staging_tables
+
+    def failing_swap(con, table_names):
+        swap_in_staging_tables(con, table_names)
+        raise RuntimeError('swap failed')
+
+    with StubCountersServer([33, 30]) as server:
+        bap.counts_to_sql_in_batches(engine, 'counts_daily', [('33', date(2024, 1, 1), date(2024, 1, 31))],
+                                     mode='B', client=make_client(server), max_workers=1, check_quality=False)
+        monkeypatch.setattr(bap, 'swap_in_staging_tables', failing_swap)
+        with pytest.raises(RuntimeError):
+            bap.counts_to_sql_in_batches(engine, 'counts_daily', [('30', date(2024, 1, 1), date(2024, 1, 31))],
+                                         if_exists='replace', mode='B', client=make_client(server), max_workers=1,
+                                         check_quality=False)
+        assert stored_counters(engine) == [33]
+        assert stored_counters(engine, 'counts_daily_staging') == [30]
+        assert bap.get_unfinished_run(engine)[2] == []
+
+        monkeypatch.undo()
+        monkeypatch.chdir(tmp_path)
+        bap.sync(resume=True, target='sqlite', db_name='counts', client=make_client(server), max_workers=1)
+    assert stored_counters(engine) == [30]
+    assert not sqlalchemy.inspect(engine).has_table('counts_daily_staging')
+    assert bap.get_unfinished_run(engine) is None
@@ -0,0 +1,71 @@
+'''
+Tests the sync_state watermarks on temporary SQLite databases.
+'''
+from datetime import date
+
+import pytest
+import sqlalchemy
+
+import BikeArlingtonPy as bap
+from benchmarks import StubCountersServer
+
+
+def make_engine(tmp_path):
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path}/counts.db')
+    bap.create_sync_state_table(engine)
+    return engine
+
+
+def test_watermarks_are_kept_per_bikeometer_interval_and_mode(tmp_path):
+    engine = make_engine(tmp_path)
+    with engine.begin() as con:
+        bap.update_watermarks(con, 'd', [('33', date(2024, 1, 1), date(2024, 1, 31))], 'B')
+        bap.update_watermarks(con, 'd', [('33', date(2024, 1, 1), date(2024, 1, 15))], 'P')
+        bap.update_watermarks(con, 'h', [('30', date(2024, 1, 1), date(2024, 2, 29))], 'B')
+    assert bap.get_watermarks(engine, 'd', 'B') == {'33': date(2024, 1, 31)}
+    assert bap.get_watermarks(engine, 'd', 'P') == {'33': date(2024, 1, 15)}
+    assert bap.get_watermarks(engine, 'h', 'B') == {'30': date(2024, 2, 29)}
+    assert bap.get_watermarks(engine, 'h', 'P') == {}
+    # Both modes have only been synced up to the older of the two
+    assert bap.get_watermarks(engine, 'd', '') == {'33': date(2024, 1, 15)}
+
+
+def test_watermarks_never_move_back(tmp_path):
+    engine = make_engine(tmp_path)
+    with engine.begin() as con:
+        bap.update_watermarks(con, 'd', [('33', date(2024, 1, 1), date(2024, 1, 31))], 'B')
+        bap.update_watermarks(con, 'd', [('33', date(2023, 1, 1), date(2023, 12, 31))], 'B')
+    assert bap.get_watermarks(engine, 'd', 'B') == {'33': date(2024, 1, 31)}
+
+
+def test_watermarks_roll_back_with_their_transaction(tmp_path):
+    engine = make_engine(tmp_path)
+    with pytest.raises(RuntimeError):
+        with engine.begin() as con:
+            bap.update_watermarks(con, 'd', [('33', date(2024, 1, 1), date(2024, 1, 31))], 'B')
+            raise RuntimeError('load failed')
+    assert bap.get_watermarks(engine, 'd', 'B') == {}
+
+
+def test_failed_write_does_not_advance_the_watermark(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    upsert_sql = bap.upsert_sql
+
+    def failing_upsert(df, table_name, connectable, **kwargs):
+        upsert_sql(df, table_name, connectable, **kwargs)
+        if 30 in set(df['bikeometer_id']):
+            raise RuntimeError('write failed')
+
+    monkeypatch.setattr(bap, 'upsert_sql', failing_upsert)
+    with StubCountersServer([33, 30]) as server:
+        client = bap.CountersClient(base_url=server.url, timeout=5, backoff_factor=0)
+        with pytest.raises(RuntimeError):
+            bap.sync(interval='d', mode='B', counters=['33', '30'], start_date=date(2024, 1, 1), end_date=date(2024, 1, 31),
+                     target='sqlite', db_name='counts', client=client, max_workers=1, batch_size=1,
+                     check_quality=False, adaptive_windows=False)
+    engine = bap.create_new_engine('counts', dialect='sqlite')
+    assert bap.get_watermarks(engine, 'd', 'B') == {'33': date(2024, 1, 31)}
+    # The next sync only plans what the failed write left out
+    jobs = bap.plan_missing_jobs(['33', '30'], bap.get_watermarks(engine, 'd', 'B'), date(2024, 2, 10),
+                                 first_date=date(2024, 1, 1))
+    assert sorted(jobs) == [('30', date(2024, 1, 1), date(2024, 2, 10)), ('33', date(2024, 2, 1), date(2024, 2, 10))]
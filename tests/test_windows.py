@@ -0,0 +1,74 @@
+'''
+Tests the calendar aligned request windows and the WindowPlanner sizing them.
+'''
+from datetime import date
+
+import BikeArlingtonPy as bap
+
+
+def windows(start_date, end_date, window_days=None):
+    return list(bap.aligned_windows(start_date, end_date, window_days))
+
+
+def test_year_windows_end_on_new_year():
+    assert windows(date(2023, 3, 15), date(2024, 2, 10)) == [(date(2023, 3, 15), date(2023, 12, 31)),
+                                                             (date(2024, 1, 1), date(2024, 2, 10))]
+
+
+def test_quarter_windows_cross_the_year():
+    # 92 days is rounded down to 3 months
+    assert windows(date(2023, 11, 20), date(2024, 4, 10), 92) == [(date(2023, 11, 20), date(2023, 12, 31)),
+                                                                  (date(2024, 1, 1), date(2024, 3, 31)),
+                                                                  (date(2024, 4, 1), date(2024, 4, 10))]
+
+
+def test_week_windows_restart_every_month():
+    assert windows(date(2024, 2, 20), date(2024, 3, 9), 7) == [(date(2024, 2, 20), date(2024, 2, 21)),
+                                                               (date(2024, 2, 22), date(2024, 2, 28)),
+                                                               (date(2024, 2, 29), date(2024, 2, 29)),
+                                                               (date(2024, 3, 1), date(2024, 3, 7)),
+                                                               (date(2024, 3, 8), date(2024, 3, 9))]
+
+
+def test_windows_do_not_depend_on_the_first_day():
+    # 40 days is rounded down to a month
+    from_first = windows(date(2023, 1, 1), date(2023, 12, 31), 40)
+    from_later = windows(date(2023, 1, 17), date(2023, 12, 31), 40)
+    assert from_later[0] == (date(2023, 1, 17), date(2023, 1, 31))
+    assert from_later[1:] == from_first[1:]
+    assert len(from_first) == 12
+
+
+def fetched(planner, window_start, window_end, http_seconds, splits=0):
+    planner.job_fetched(('33', window_start, window_end),
+                        {'bytes': 1000, 'requests': 1, 'splits': splits, 'http_seconds': http_seconds})
+
+
+def test_planner_shrinks_windows_that_time_out_and_grows_them_back(tmp_path):
+    planner = bap.WindowPlanner('d', 'B', path=str(tmp_path / 'window_stats.json'))
+    # Before anything is learned a year of daily counts fits in one response
+    assert planner.window_days('33') is None
+    fetched(planner, date(2024, 1, 1), date(2024, 1, 28), http_seconds=planner.target_seconds * 2)
+    assert planner.window_days('33') == 14
+    fetched(planner, date(2024, 1, 29), date(2024, 2, 11), http_seconds=0.1, splits=1)
+    assert planner.window_days('33') == 7
+    grown = []
+    window_start = date(2024, 2, 12)
+    while planner.window_days('33') is not None:
+        days = planner.window_days('33')
+        grown.append(days)
+        window_end = date.fromordinal(window_start.toordinal() + days - 1)
+        fetched(planner, window_start, window_end, http_seconds=0.1)
+        window_start = date.fromordinal(window_end.toordinal() + 1)
+    assert grown == sorted(grown) and grown[0] == 7 and len(grown) > 3
+    # Other bikeometers aren't capped
+    assert planner.window_days('30') is None
+
+
+def test_planner_keeps_what_it_learned_per_profile(tmp_path):
+    path = str(tmp_path / 'window_stats.json')
+    planner = bap.WindowPlanner('d', 'B', path=path)
+    fetched(planner, date(2024, 1, 1), date(2024, 1, 28), http_seconds=planner.target_seconds * 2)
+    planner.run_finished()
+    assert bap.WindowPlanner('d', 'B', path=path).window_days('33') == 14
+    assert bap.WindowPlanner('d', 'P', path=path).window_days('33') is None